@@ -1,16 +1,28 @@
+import functools
+import hashlib
+import itertools
+import multiprocessing
 import os
+import sqlite3
 import sys
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
-from torch import cuda, device as _device
-from torch.utils.data import Dataset
+import pyarrow as pa
+from pyarrow import csv
+from torch import (
+    bfloat16, cuda, device as _device, float32, inference_mode, int8, set_num_threads
+)
+from torch.utils.data import DataLoader, Dataset
 if 'pytest' not in sys.modules:
-    from transformers import pipeline
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
 
 
 class ClassificationPipeline:
-    def __init__(self, batch_size=64, device=None):
+    def __init__(self, batch_size=64, device=None, num_workers=0, cache_path=None,
+                 quantize=False):
         """A class for classifying the topic and sentiment of text data.
 
         Parameters
@@ -20,22 +32,40 @@ class ClassificationPipeline:
         device : str or torch.device, optional
             The device on which to run the models. If not provided, will default
             to GPU if available, else CPU.
+        num_workers : int, optional
+            The number of worker processes used to tokenize batches while the
+            models are running. Default is 0, i.e. tokenize in the main process.
+        cache_path : str, optional
+            Path to an SQLite file where the predicted labels of each headline are
+            cached, so headlines classified before are not run through the models
+            again. The cached labels are only reused by pipelines with the same
+            models, model revisions and quantization, and not at all if the
+            version of the models is unknown. Default is None, i.e. no cache.
+        quantize : bool, optional
+            If True, run the linear layers of the models with dynamic int8
+            quantization when on CPU. Faster, at the cost of slightly different
+            predictions. Default is False.
         """
         if device is None:
             device = _device("cuda:0" if cuda.is_available() else "cpu")
         elif isinstance(device, str):
             device = _device(device)
 
-        self.topic_model = _Model(
-            "hakonmh/topic-xdistil-uncased",
-            batch_size=batch_size,
-            device=device
-        )
-        self.sentiment_model = _Model(
-            "hakonmh/sentiment-xdistil-uncased",
-            batch_size=batch_size,
-            device=device
-        )
+        # Both models are fine-tuned from the same base model, so they share a tokenizer
+        self.tokenizer = _Tokenizer("hakonmh/topic-xdistil-uncased")
+        self.topic_model = _get_model("hakonmh/topic-xdistil-uncased", device, quantize)
+        self.sentiment_model = _get_model("hakonmh/sentiment-xdistil-uncased", device,
+                                          quantize)
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.device = device
+        self.cache = None
+        models = [self.topic_model, self.sentiment_model]
+        if cache_path is not None and any(model.version is None for model in models):
+            warnings.warn('The version of the models is unknown, so their predictions '
+                          'are not cached.')
+        elif cache_path is not None:
+            self.cache = _PredictionCache(cache_path, models)
 
     def predict(self, data):
         """Predict the topics and sentiments of the given text data.
@@ -51,11 +81,16 @@ class ClassificationPipeline:
             DataFrame with columns for the classified topics and sentiments.
         """
         dataset = TextDataset(data)
-        topics = self.topic_model.predict(dataset)
-        sentiments = self.sentiment_model.predict(dataset)
+        if self.cache is None:
+            topic_codes, sentiment_codes = self._predict_labels(dataset)
+        else:
+            topic_codes, sentiment_codes = self._predict_labels_with_cache(dataset.texts)
+        topics = pd.Categorical.from_codes(topic_codes, self.topic_model.labels)
+        sentiments = pd.Categorical.from_codes(sentiment_codes, self.sentiment_model.labels)
 
         if isinstance(data, pd.DataFrame):
-            df = data.copy()
+            # Shallow copy so the input columns are shared rather than duplicated
+            df = data.copy(deep=False)
             df['model topic'] = topics
             df['sentiment'] = sentiments
         else:
@@ -65,9 +100,99 @@ class ClassificationPipeline:
                  'sentiment': sentiments}
             )
             df.index = dataset.index
-            df['headline'] = df['headline'].astype(str)
         return df
 
+    def _predict_labels_with_cache(self, texts):
+        """Predict the topics and sentiments of the texts, using the cached labels
+        of texts that have been classified before.
+
+        Parameters
+        ----------
+        texts : list
+            The texts to be classified.
+
+        Returns
+        -------
+        tuple of ndarray
+            The label ids of the predicted topics and sentiments of the texts.
+        """
+        keys = [self.cache.hash(text) for text in texts]
+        cached_labels = self.cache.get(keys)
+        is_cached = np.fromiter((key in cached_labels for key in keys), dtype=bool,
+                                count=len(keys))
+        uncached = np.flatnonzero(~is_cached)
+
+        topics = np.empty(len(texts), dtype=np.int8)
+        sentiments = np.empty(len(texts), dtype=np.int8)
+        topics[uncached], sentiments[uncached] = self._predict_labels(
+            TextDataset([texts[i] for i in uncached])
+        )
+        topic_ids = {label: i for i, label in enumerate(self.topic_model.labels)}
+        sentiment_ids = {label: i for i, label in enumerate(self.sentiment_model.labels)}
+        for i in np.flatnonzero(is_cached):
+            topic, sentiment = cached_labels[keys[i]]
+            topics[i] = topic_ids[topic]
+            sentiments[i] = sentiment_ids[sentiment]
+
+        self.cache.put(
+            (keys[i],
+             self.topic_model.labels[topics[i]],
+             self.sentiment_model.labels[sentiments[i]])
+            for i in uncached
+        )
+        return topics, sentiments
+
+    def _predict_labels(self, dataset):
+        """Predict the topics and sentiments of the texts in the dataset.
+
+        Each batch is tokenized once and fed to both models. On GPU the two models
+        run concurrently, each on its own CUDA stream, since a single distilled
+        model leaves most of the GPU idle.
+
+        The texts are batched in order of length, so each batch is padded to a
+        length close to that of its texts. The labels are returned in the
+        original order.
+
+        Parameters
+        ----------
+        dataset : TextDataset
+            The texts to be classified.
+
+        Returns
+        -------
+        tuple of ndarray
+            The label ids of the predicted topics and sentiments of the texts.
+        """
+        # Character length is a cheap proxy for the number of tokens
+        order = np.argsort([len(text) for text in dataset.texts], kind='stable')
+        loader = DataLoader(
+            dataset,
+            batch_size=self.batch_size,
+            sampler=order.tolist(),
+            collate_fn=self.tokenizer,
+            num_workers=self.num_workers,
+            pin_memory=_is_cuda_device(self.device)
+        )
+        models = [self.topic_model, self.sentiment_model]
+        topics, sentiments = [np.empty(0, dtype=np.int8)], [np.empty(0, dtype=np.int8)]
+        with ThreadPoolExecutor(max_workers=len(models)) as executor:
+            run = executor.map if _is_cuda_device(self.device) else map
+            for inputs in loader:
+                batch_topics, batch_sentiments = run(
+                    lambda model: model.predict(inputs), models
+                )
+                topics.append(batch_topics)
+                sentiments.append(batch_sentiments)
+        topics, sentiments = np.concatenate(topics), np.concatenate(sentiments)
+        return _unsort(topics, order), _unsort(sentiments, order)
+
+
+def _unsort(values, order):
+    """Put values given in the sort order back in the original order."""
+    unsorted = np.empty_like(values)
+    unsorted[order] = values
+    return unsorted
+
 
 class TextDataset(Dataset):
     def __init__(self, texts):
@@ -98,53 +223,307 @@ class TextDataset(Dataset):
         return self.texts[i]
 
 
+class _PredictionCache:
+    def __init__(self, path, models):
+        """An SQLite cache of the predicted labels of texts, keyed by a hash of the
+        text.
+
+        The hashes are keyed by the versions and labels of the models, so labels
+        predicted by other models, model revisions or quantization settings are
+        never returned, even if they are stored in the same file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite file. Created if it does not exist.
+        models : list of _Model
+            The models whose predicted labels are cached.
+        """
+        models_version = ';'.join(
+            f"{model.version}:{','.join(model.labels)}" for model in models
+        )
+        self.hash_key = hashlib.blake2b(models_version.encode(), digest_size=32).digest()
+        # Wait for other processes sharing the cache to finish writing
+        self.connection = sqlite3.connect(path, timeout=60)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(hash BLOB PRIMARY KEY, topic TEXT, sentiment TEXT)"
+            )
+
+    def hash(self, text):
+        """Hash a text into a short key for the cache."""
+        return hashlib.blake2b(text.encode(), digest_size=8, key=self.hash_key).digest()
+
+    def get(self, keys):
+        """Get the cached labels of the given keys.
+
+        Parameters
+        ----------
+        keys : list of bytes
+            The hashes of the texts.
+
+        Returns
+        -------
+        dict
+            The (topic, sentiment) labels of each key found in the cache.
+        """
+        MAX_QUERY_SIZE = 900  # Stay below SQLite's limit on query parameters
+        labels = {}
+        for start in range(0, len(keys), MAX_QUERY_SIZE):
+            batch = keys[start:start + MAX_QUERY_SIZE]
+            rows = self.connection.execute(
+                "SELECT hash, topic, sentiment FROM predictions "
+                f"WHERE hash IN ({', '.join('?' * len(batch))})",
+                batch
+            )
+            labels.update((key, (topic, sentiment)) for key, topic, sentiment in rows)
+        return labels
+
+    def put(self, rows):
+        """Add predicted labels to the cache.
+
+        Parameters
+        ----------
+        rows : iterable of tuple
+            The key, topic and sentiment of each text.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO predictions VALUES (?, ?, ?)", rows
+            )
+
+
+class _Tokenizer:
+    def __init__(self, model_name):
+        """A class for tokenizing batches of text for the classification models.
+
+        Parameters
+        ----------
+        model_name : str
+            The name of the model whose tokenizer to use. Must be a model from the
+            HuggingFace model hub.
+        """
+        # The Rust tokenizer is much faster at tokenizing whole batches
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+    def __call__(self, texts):
+        """Tokenize the given texts into a padded batch of tensors.
+
+        Parameters
+        ----------
+        texts : list
+            The texts to be tokenized.
+
+        Returns
+        -------
+        BatchEncoding
+            The token ids and attention mask of the texts.
+        """
+        return self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors='pt'
+        )
+
+
 class _Model:
-    def __init__(self, model_name, batch_size=64, device=None):
-        """A class for a classification model pipeline.
+    def __init__(self, model_name, device=None, quantize=False):
+        """A class for a sequence classification model.
 
         Parameters
         ----------
         model_name : str
             The name of the model to use. Must be a model from the HuggingFace
             model hub.
-        batch_size : int, optional
-            The batch size to use for the models. Default is 64.
         device : str or torch.device, optional
-            The device on which to run the models. Default is GPU if available.
+            The device on which to run the model. Default is CPU.
+        quantize : bool, optional
+            If True, quantize the weights of the linear layers to int8 when on
+            CPU. Default is False.
         """
-        self.pipeline = pipeline(
-            "text-classification",
-            model=model_name,
-            tokenizer=model_name,
-            batch_size=batch_size,
-            device=device,
-            max_length=512,
-            truncation=True
+        self.device = _device(device) if device is not None else _device("cpu")
+        self.model = AutoModelForSequenceClassification.from_pretrained(
+            model_name,
+            dtype=_model_dtype(self.device)
         )
-
-    def predict(self, texts):
-        """Predict the classifications of the given texts.
+        self.model.to(self.device).eval()
+        self.version = _model_version(model_name, self.model.config)
+        if quantize and not _is_cuda_device(self.device):
+            self.model, backend = _quantize(self.model)
+            if self.version is not None:
+                # The backends round differently, so their predictions can differ
+                self.version += f"+int8-{backend}"
+        id2label = self.model.config.id2label
+        self.labels = [id2label[i] for i in range(len(id2label))]
+        self.stream = cuda.Stream(self.device) if _is_cuda_device(self.device) else None
+
+    def predict(self, inputs):
+        """Predict the classifications of the given tokenized texts.
 
         Parameters
         ----------
-        texts : list
-            The texts to be classified.
+        inputs : BatchEncoding
+            The tokenized texts to be classified.
 
         Returns
         -------
-        list
-            The predicted classifications of the texts.
+        ndarray
+            The label ids of the predicted classifications of the texts, indexing
+            into `labels`.
         """
-        warnings.filterwarnings('ignore')
-        predictions = [pred['label'] for pred in self.pipeline(texts)]
-        warnings.resetwarnings()
-        return predictions
+        with inference_mode(), cuda.stream(self.stream):  # No-op stream if not on GPU
+            inputs = inputs.to(self.device)
+            label_ids = self.model(**inputs).logits.argmax(dim=-1).to(int8)
+            # Copy on the model's stream, so the copy waits for the model to finish
+            return label_ids.cpu().numpy()
+
+
+@functools.lru_cache(maxsize=4)
+def _get_model(model_name, device, quantize=False):
+    """Load a sequence classification model, reusing it if already loaded.
+
+    Parameters
+    ----------
+    model_name : str
+        The name of the model to use. Must be a model from the HuggingFace model
+        hub.
+    device : torch.device
+        The device on which to run the model.
+    quantize : bool, optional
+        If True, quantize the linear layers of the model to int8 when on CPU.
+        Default is False.
+
+    Returns
+    -------
+    _Model
+        The loaded model, shared by all pipelines using it on the same device.
+    """
+    return _Model(model_name, device=device, quantize=quantize)
+
+
+def _model_version(model_name, config):
+    """Get a version identifying the weights of a model, used to key the cached
+    predictions of the model.
+
+    Models from the HuggingFace model hub are identified by their revision. Models
+    loaded from a local folder have no revision, so they are identified by a hash
+    of the files in the folder instead.
+
+    Parameters
+    ----------
+    model_name : str
+        The name of the model on the HuggingFace model hub, or the path to the
+        folder it was loaded from.
+    config : PretrainedConfig
+        The config of the loaded model.
+
+    Returns
+    -------
+    str or None
+        The version of the model, or None if it is unknown.
+    """
+    revision = getattr(config, '_commit_hash', None)
+    if revision is not None:
+        return f"{model_name}@{revision}"
+    if os.path.isdir(model_name):
+        return f"{model_name}@{_hash_folder(model_name)}"
+    return None
+
+
+def _hash_folder(folder):
+    """Hash the names and contents of the files in a folder."""
+    CHUNK_SIZE = 2**20
+    folder_hash = hashlib.blake2b(digest_size=16)
+    for name in _list_files(folder, ""):
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path):
+            continue
+        folder_hash.update(name.encode() + b"\0")
+        with open(path, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                folder_hash.update(chunk)
+    return folder_hash.hexdigest()
+
+
+def _quantize(model):
+    """Quantize the linear layers of a model to int8, with activations quantized
+    dynamically at run time.
+
+    Uses the eager-mode `torch.ao.quantization.quantize_dynamic`, which has fast
+    int8 CPU kernels but is deprecated in favour of torchao. Its deprecation
+    warnings are silenced. If the installed version of torch no longer has it,
+    falls back to torchao's `Int8DynamicActivationInt8WeightConfig`, which without
+    `torch.compile` is no faster than full precision on CPU. Raises an ImportError
+    if neither is available.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The model to quantize, on CPU.
+
+    Returns
+    -------
+    torch.nn.Module
+        The quantized model.
+    str
+        The name of the quantization backend that was used.
+    """
+    try:
+        from torch import nn, qint8
+        from torch.ao.quantization import quantize_dynamic
+    except (ImportError, AttributeError):
+        pass
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            warnings.simplefilter('ignore', DeprecationWarning)
+            return quantize_dynamic(model, {nn.Linear}, dtype=qint8), 'torch.ao'
+
+    try:
+        from torchao.quantization import Int8DynamicActivationInt8WeightConfig, quantize_
+    except ImportError:
+        raise ImportError('This version of torch cannot quantize the models without '
+                          'torchao, install it with `pip install torchao`.')
+    quantize_(model, Int8DynamicActivationInt8WeightConfig())
+    return model, 'torchao'
+
+
+def _model_dtype(device):
+    """Get the dtype to run the models in on the given device.
+
+    Uses bfloat16 on GPUs with native support for it (Ampere or newer), since the
+    models are compute-bound and bfloat16 roughly doubles their throughput there.
+
+    Parameters
+    ----------
+    device : str or torch.device or None
+        The device on which the models will run.
+
+    Returns
+    -------
+    torch.dtype
+        The dtype to load the models in.
+    """
+    if _is_cuda_device(device) and cuda.get_device_capability(device)[0] >= 8:
+        return bfloat16
+    return float32
+
+
+def _is_cuda_device(device):
+    """Check whether the given device is a CUDA device."""
+    return device is not None and _device(device).type == 'cuda'
 
 
 def classify_full_history(
     input_folder='data/raw-nyt-data',
     output_folder='data/classified-nyt-data',
-    overwrite=False
+    overwrite=False,
+    num_processes=1,
+    cache_path=None,
+    quantize=False
 ):
     """Classify the sentiment and topic of headlines for all files in a given folder.
 
@@ -156,16 +535,28 @@ def classify_full_history(
         Path to the folder where the output files will be stored.
     overwrite : bool, optional
         Whether to overwrite existing output files.
+    num_processes : int, optional
+        The number of processes used to classify the files when running on CPU.
+        Each process loads its own copy of the models and classifies a year of
+        files at a time. Ignored if a GPU is available. Default is 1.
+    cache_path : str, optional
+        Path to an SQLite file caching the predicted labels of each headline, so
+        headlines classified before are not run through the models again.
+        Default is None, i.e. no cache.
+    quantize : bool, optional
+        If True, run the models with dynamic int8 quantization when on CPU, also in
+        the worker processes. Default is False.
     """
     os.makedirs(output_folder, exist_ok=True)
+    _convert_csv_classified_files(output_folder)
 
-    pipeline = ClassificationPipeline()
-    for f in _files_to_classify(input_folder, output_folder, overwrite):
-        df = pd.read_csv(os.path.join(input_folder, f), index_col=0)
-        df['headline'] = df['headline'].astype(str)
-        df = df.dropna(subset=['headline'])
-        classified_df = pipeline.predict(df)
-        classified_df.to_csv(os.path.join(output_folder, f))
+    files = _files_to_classify(input_folder, output_folder, overwrite)
+    if num_processes > 1 and not cuda.is_available():
+        _classify_files_in_processes(files, input_folder, output_folder, num_processes,
+                                     cache_path, quantize)
+    else:
+        pipeline = ClassificationPipeline(cache_path=cache_path, quantize=quantize)
+        _classify_files(pipeline, files, input_folder, output_folder)
 
 
 def _files_to_classify(input_folder, output_folder, overwrite):
@@ -185,20 +576,222 @@ def _files_to_classify(input_folder, output_folder, overwrite):
     list
         The names of the files to be classified.
     """
+    input_files = _list_files(input_folder, ".csv")
     if overwrite:
-        files = os.listdir(input_folder)
-    else:
-        # get files in input_folder that are not in output_folder
-        input_files = os.listdir(input_folder)
-        output_files = os.listdir(output_folder)
-        files = list(set(input_files) - set(output_files))
-        files = sorted(files)
-    return [f for f in files if f.endswith(".csv")]
+        return input_files
+    # get files in input_folder that are not in output_folder, keeping the sort order
+    classified_files = {_raw_file_name(f) for f in _list_files(output_folder, ".feather")}
+    return [f for f in input_files if f not in classified_files]
+
+
+def _convert_csv_classified_files(output_folder):
+    """Convert classified CSV files made by earlier versions to Feather files.
+
+    Months that already have a Feather file are skipped, so each CSV file is only
+    converted once. The CSV files are left in place and are no longer used.
+
+    Parameters
+    ----------
+    output_folder : str
+        Path to the folder where the classified files are stored.
+    """
+    classified_files = set(_list_files(output_folder, ".feather"))
+    for f in _list_files(output_folder, ".csv"):
+        if _classified_file_name(f) in classified_files:
+            continue
+        classified_df = pd.read_csv(
+            os.path.join(output_folder, f), index_col=0, parse_dates=True,
+            dtype={'model topic': 'category', 'sentiment': 'category'}
+        ).dropna(subset=['headline'])
+        classified_df['word count'] = _count_words(classified_df['headline'])
+        _write_classified_file(classified_df, output_folder, f)
+
+
+def _list_files(folder, extension):
+    """Get the sorted names of the files in a folder with the given extension."""
+    with os.scandir(folder) as entries:
+        return sorted(entry.name for entry in entries if entry.name.endswith(extension))
+
+
+def _classify_files(pipeline, files, input_folder, output_folder):
+    """Classify the given raw data files and write the results to the output folder.
+
+    All files from the same year are classified in a single call to the pipeline,
+    so the model batches stay full even for months with few headlines.
+
+    Parameters
+    ----------
+    pipeline : ClassificationPipeline
+        The pipeline used to classify the headlines.
+    files : list
+        The names of the raw data files to be classified.
+    input_folder : str
+        Path to the folder containing the input files.
+    output_folder : str
+        Path to the folder where the output files will be stored.
+    """
+    for year_files in _group_files_by_year(files):
+        dfs = [_read_raw_file(os.path.join(input_folder, f)) for f in year_files]
+        classified_df = pipeline.predict(pd.concat(dfs))
+        classified_df['word count'] = _count_words(classified_df['headline'])
+
+        start = 0
+        for f, df in zip(year_files, dfs):
+            end = start + len(df)
+            _write_classified_file(classified_df.iloc[start:end], output_folder, f)
+            start = end
+
+
+def _count_words(headlines):
+    """Count the number of whitespace-separated words in each headline.
+
+    Stored with the classified data, so the index does not have to split every
+    headline again each time it is built.
+    """
+    headlines = headlines.to_numpy(dtype=object)
+    return np.fromiter((len(h.split()) for h in headlines), dtype=np.int16,
+                       count=len(headlines))
+
+
+def _group_files_by_year(files):
+    """Split the sorted file names into lists of files from the same year."""
+    return [list(year_files) for _, year_files
+            in itertools.groupby(sorted(files), key=lambda f: f[:4])]
+
+
+def _classify_files_in_processes(
+    files, input_folder, output_folder, num_processes, cache_path=None, quantize=False
+):
+    """Classify the given raw data files on CPU using a pool of processes.
+
+    Every process classifies one year of files at a time with its own pipeline.
+    The CPU threads are split evenly between the processes to avoid
+    oversubscription.
+
+    Parameters
+    ----------
+    files : list
+        The names of the raw data files to be classified.
+    input_folder : str
+        Path to the folder containing the input files.
+    output_folder : str
+        Path to the folder where the output files will be stored.
+    num_processes : int
+        The number of processes to use.
+    cache_path : str, optional
+        Path to an SQLite file caching the predicted labels of each headline,
+        shared by all processes. Default is None, i.e. no cache.
+    quantize : bool, optional
+        If True, run the models with dynamic int8 quantization. Default is False.
+    """
+    num_threads = max(1, os.cpu_count() // num_processes)
+    with ProcessPoolExecutor(
+        max_workers=num_processes,
+        # Forking a process after torch has started its thread pools can deadlock
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(input_folder, output_folder, num_threads, cache_path, quantize)
+    ) as executor:
+        for _ in executor.map(_classify_files_in_worker, _group_files_by_year(files)):
+            pass  # Consume the results to raise any errors from the workers
+
+
+_worker_state = {}
+
+
+def _init_worker(input_folder, output_folder, num_threads, cache_path, quantize):
+    """Load the pipeline once in each worker process of the process pool."""
+    set_num_threads(num_threads)
+    _worker_state['pipeline'] = ClassificationPipeline(
+        device='cpu', cache_path=cache_path, quantize=quantize
+    )
+    _worker_state['input_folder'] = input_folder
+    _worker_state['output_folder'] = output_folder
+
+
+def _classify_files_in_worker(files):
+    """Classify the given raw data files using the pipeline of the worker process."""
+    _classify_files(
+        _worker_state['pipeline'],
+        files,
+        _worker_state['input_folder'],
+        _worker_state['output_folder']
+    )
+
+
+def _read_raw_file(file_path):
+    """Read a CSV file of raw NYT data.
+
+    Quoted headlines may span several lines. Rows broken up by an unquoted line
+    break in a headline, as written by earlier versions for headlines with a
+    carriage return, are skipped instead of failing the whole file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the CSV file.
+
+    Returns
+    -------
+    DataFrame
+        DataFrame of Arrow-backed headlines indexed by publication date.
+    """
+    COLUMN_TYPES = {
+        'date': pa.timestamp('ns'),
+        'headline': pa.string(),
+        'topic': pa.string()
+    }
+    convert_options = csv.ConvertOptions(
+        column_types=COLUMN_TYPES,
+        strings_can_be_null=True  # Read empty headlines as missing, like pandas does
+    )
+    parse_options = csv.ParseOptions(
+        newlines_in_values=True,
+        invalid_row_handler=lambda row: 'skip'
+    )
+    with open(file_path, 'rb') as f:
+        table = csv.read_csv(f, parse_options=parse_options,
+                             convert_options=convert_options)
+    df = table.to_pandas(types_mapper={pa.string(): pd.ArrowDtype(pa.string())}.get)
+    df = df.set_index('date').dropna(subset=['headline'])
+    return df
+
+
+def _write_classified_file(classified_df, output_folder, raw_file_name):
+    """Write classified data to a Feather file in the output folder.
+
+    The news desk topics are few and repeated for many headlines, so they are
+    stored dictionary-encoded, like the label columns.
+
+    Parameters
+    ----------
+    classified_df : DataFrame
+        The classified data, indexed by publication date.
+    output_folder : str
+        Path to the folder where the output file will be stored.
+    raw_file_name : str
+        The name of the raw data file the classified data was created from.
+    """
+    file_path = os.path.join(output_folder, _classified_file_name(raw_file_name))
+    classified_df = classified_df.assign(topic=classified_df['topic'].astype('category'))
+    classified_df.reset_index().to_feather(file_path, compression='zstd')
+
+
+def _classified_file_name(raw_file_name):
+    """Convert the name of a raw data file to the name of its classified file."""
+    return raw_file_name.replace(".csv", ".feather")
+
+
+def _raw_file_name(classified_file_name):
+    """Convert the name of a classified file to the name of its raw data file."""
+    return classified_file_name.replace(".feather", ".csv")
 
 
 def classify_latest(
     input_folder='data/raw-nyt-data',
-    output_folder='data/classified-nyt-data'
+    output_folder='data/classified-nyt-data',
+    cache_path=None,
+    quantize=False
 ):
     """Classify the sentiment and topic of headlines for data in the input folder
     that has not been classified yet.
@@ -209,33 +802,63 @@ def classify_latest(
         Path to the folder containing the input files.
     output_folder : str, optional
         Path to the folder where the output files will be stored.
+    cache_path : str, optional
+        Path to an SQLite file caching the predicted labels of each headline, so
+        headlines classified before are not run through the models again.
+        Default is None, i.e. no cache.
+    quantize : bool, optional
+        If True, run the models with dynamic int8 quantization when on CPU.
+        Default is False.
     """
-    pipeline = ClassificationPipeline()
-    for f in _files_not_classified(input_folder, output_folder):
-        df = pd.read_csv(os.path.join(input_folder, f), index_col=0)
-        df['headline'] = df['headline'].astype(str)
-        df = df.dropna(subset=['headline'])
-        classified_df = pipeline.predict(df)
-        classified_df.to_csv(os.path.join(output_folder, f))
+    pipeline = ClassificationPipeline(cache_path=cache_path, quantize=quantize)
+    _convert_csv_classified_files(output_folder)
+    unclassified_files = _files_to_classify(input_folder, output_folder, overwrite=False)
+    # Update latest classified file in case raw data has been updated since last round
+    latest_classified_file = _list_files(output_folder, ".feather")[-1]
+    _update_classified_file(pipeline, _raw_file_name(latest_classified_file),
+                            input_folder, output_folder)
+    _classify_files(pipeline, unclassified_files, input_folder, output_folder)
 
 
-def _files_not_classified(input_folder, output_folder):
-    """Get the names of files not yet classified.
+def _update_classified_file(pipeline, file, input_folder, output_folder):
+    """Classify a raw data file that has been classified before, only running the
+    models on the headlines missing from its classified file.
 
-    Includes the file with the latest date in the input_folder since it might contain
-    unclassified data if the raw data has been updated since last classification.
+    Headlines are matched on their publication date and text, and the classified
+    file is rewritten in the order of the raw data file.
 
     Parameters
     ----------
+    pipeline : ClassificationPipeline
+        The pipeline used to classify the new headlines.
+    file : str
+        The name of the raw data file to be classified.
     input_folder : str
         Path to the folder containing the input files.
     output_folder : str
-        Path to the folder where the output files are or will be stored.
-
-    Returns
+        Path to the folder where the output files are stored.
     """
-    files = _files_to_classify(input_folder, output_folder, overwrite=False)
-    # Re-classify latest file in case raw data has been updated since last round
-    latest_classified_file = os.listdir(output_folder)[-1]
-    files.insert(0, latest_classified_file)
-    return files
+    raw_df = _read_raw_file(os.path.join(input_folder, file))
+    classified_df = pd.read_feather(
+        os.path.join(output_folder, _classified_file_name(file)),
+        columns=['date', 'headline', 'model topic', 'sentiment']
+    )
+    classified_df = classified_df.set_index(['date', 'headline'])
+    classified_df = classified_df[~classified_df.index.duplicated()]
+    keys = pd.MultiIndex.from_arrays(
+        [raw_df.index, raw_df['headline'].to_numpy(dtype=object)]
+    )
+    old_labels = classified_df.reindex(keys)
+    is_new = old_labels['sentiment'].isna().to_numpy()
+
+    df = raw_df.copy(deep=False)
+    new_labels = pipeline.predict(raw_df[is_new]) if is_new.any() else None
+    for col, model in [('model topic', pipeline.topic_model),
+                       ('sentiment', pipeline.sentiment_model)]:
+        dtype = pd.CategoricalDtype(model.labels)
+        codes = old_labels[col].astype(dtype).cat.codes.to_numpy(copy=True)
+        if new_labels is not None:
+            codes[is_new] = new_labels[col].cat.codes.to_numpy()
+        df[col] = pd.Categorical.from_codes(codes, dtype=dtype)
+    df['word count'] = _count_words(df['headline'])
+    _write_classified_file(df, output_folder, file)
@@ -1,90 +1,396 @@
+import bisect
+import functools
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from numba import njit
+from pyarrow import csv, feather
 
 
 def create_sentiment_index(
     input_folder='data/classified-nyt-data',
-    output_path='data/nyt-index.csv'
+    output_path='data/nyt-index.parquet',
+    num_processes=1,
+    cache_folder=None
 ):
     """Create sentiment index file using classified headlines from input folder.
 
     Parameters
     ----------
     input_folder : str, optional
-        Path to the folder containing CSV files of classified NYT data, by
+        Path to the folder containing Feather files of classified NYT data, by
         default 'data/classified-nyt-data'.
     output_path : str, optional
-        Path where the output CSV file will be stored, by default
-        'data/nyt-index.csv'.
+        Path where the output file will be stored, by default
+        'data/nyt-index.parquet'. The file format is given by the file extension,
+        either '.parquet', '.arrows', '.feather' or '.csv'.
+    num_processes : int, optional
+        The number of processes used to convert the monthly files of headlines
+        into the index. Default is 1, i.e. convert them in the main process. The
+        processes are spawned, so with more than one the calling script must guard
+        its entry point with `if __name__ == '__main__':`.
+    cache_folder : str, optional
+        Path to a folder where the index rows of each past month are cached, so
+        months whose classified file has not changed are not converted again.
+        Default is None, i.e. no cache.
 
     Returns
     -------
     pd.DataFrame
         The index as a pandas DataFrame.
     """
-    create_index_file(output_path)
-
-    for f in os.listdir(input_folder):
-        file_path = os.path.join(input_folder, f)
-        classified_headlines = pd.read_csv(file_path, index_col=0, parse_dates=True)
-        df = convert_headlines_df_to_index(classified_headlines)
-        if df is not None:
-            df.to_csv(output_path, header=False, mode='a')
+    files = _list_classified_files(input_folder)
+    file_paths = [os.path.join(input_folder, f) for f in files]
+    today = pd.Timestamp.today().floor('D')
+    frames = list(_convert_classified_files(file_paths, today, num_processes, cache_folder))
 
-    index_df = add_smoothed_col_to_index_df(output_path)
-    index_df.to_csv(output_path)
+    # Write all months at once instead of appending to the file once per month
+    index_df = pd.concat(frames) if frames else _empty_index_df()
+    index_df = _add_smoothed_col(index_df)
+    _write_index_to_file(index_df, output_path)
     return index_df
 
 
 def append_sentiment_index(
     input_folder='data/classified-nyt-data',
-    output_path='data/nyt-index.csv'
+    output_path='data/nyt-index.parquet',
+    num_processes=1,
+    cache_folder=None
 ):
     """Append new data to the sentiment index file from the given input folder.
 
+    If there is no index at `output_path`, but a CSV index with the same name,
+    e.g. 'data/nyt-index.csv' made by earlier versions, the CSV index is appended
+    to and written to `output_path` in its format.
+
     Parameters
     ----------
     input_folder : str, optional
-        Path to the folder containing CSV files of classified NYT data, by
+        Path to the folder containing Feather files of classified NYT data, by
         default 'data/classified-nyt-data'.
     output_path : str, optional
-        Path where the output CSV file will be stored, by default
-        'data/nyt-index.csv'.
+        Path where the output file will be stored, by default
+        'data/nyt-index.parquet'. The file format is given by the file extension,
+        either '.parquet', '.arrows', '.feather' or '.csv'.
+    num_processes : int, optional
+        The number of processes used to convert the monthly files of headlines
+        into the index. Default is 1, i.e. convert them in the main process. The
+        processes are spawned, so with more than one the calling script must guard
+        its entry point with `if __name__ == '__main__':`.
+    cache_folder : str, optional
+        Path to a folder where the index rows of each past month are cached, so
+        months whose classified file has not changed are not converted again.
+        Default is None, i.e. no cache.
 
     Returns
     -------
     pd.DataFrame
         The index as a pandas DataFrame.
     """
-    index_df = pd.read_csv(output_path, index_col=0, parse_dates=True)
-    index_df = index_df[['negative', 'neutral', 'positive', 'total', 'index_value']]
+    index_path = _existing_index_path(output_path)
+    index_df = _read_index_file(
+        index_path,
+        columns=['negative', 'neutral', 'positive', 'total', 'index_value']
+    )
     append_start_date = index_df.index[-1] + pd.DateOffset(days=1)
 
-    for f in files_missing_in_index(input_folder, append_start_date):
-        file_path = os.path.join(input_folder, f)
-        classified_headlines = pd.read_csv(file_path, index_col=0, parse_dates=True)
-        df = convert_headlines_df_to_index(classified_headlines)
-        if df is not None:
-            df = df.loc[append_start_date:]
-            df['smoothed_index_value'] = 0
-            df.to_csv(output_path, header=False, mode='a')
-
-    index_df = add_smoothed_col_to_index_df(output_path)
-    index_df.to_csv(output_path)
+    today = pd.Timestamp.today().floor('D')
+    frames = [index_df]
+    files = files_missing_in_index(input_folder, append_start_date)
+    file_paths = [os.path.join(input_folder, f) for f in files]
+    for df in _convert_classified_files(file_paths, today, num_processes, cache_folder):
+        frames.append(df.loc[append_start_date:])
+    index_df = _add_smoothed_col(pd.concat(frames))
+
+    # The smoothed values only depend on earlier days, so existing rows stay the same
+    if output_path.endswith('.arrows') and index_path == output_path:
+        _append_to_arrow_stream_file(index_df.loc[append_start_date:], output_path)
+    else:
+        _write_index_to_file(index_df, output_path)
     return index_df
 
 
+def _existing_index_path(output_path):
+    """Get the path of the index to append to, falling back to a CSV index with
+    the same name if there is no index at `output_path`."""
+    legacy_path = os.path.splitext(output_path)[0] + '.csv'
+    if not os.path.exists(output_path) and os.path.exists(legacy_path):
+        return legacy_path
+    return output_path
+
+
 def create_index_file(file_path):
     """Create an empty index file with specified column names.
 
     Parameters
     ----------
     file_path : str
-        Path where the output CSV file will be stored.
+        Path where the output file will be stored.
     """
+    _write_index_to_file(_empty_index_df(), file_path)
+
+
+def _empty_index_df():
+    """Create an empty index DataFrame with the index column names."""
     COLUMN_NAMES = ['date', 'negative', 'neutral', 'positive',
                     'total', 'index_value']
-    pd.DataFrame(columns=COLUMN_NAMES).to_csv(file_path, index=False)
+    return pd.DataFrame(columns=COLUMN_NAMES).set_index('date')
+
+
+def _read_index_file(file_path, columns=None):
+    """Read an index file in Parquet, Arrow IPC stream, Feather or CSV format.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the index file. The format is given by the file extension.
+    columns : list, optional
+        The columns to read. Reads all columns if not given. Parquet and Feather
+        files only read the requested columns from disk, CSV files only convert
+        the requested columns.
+
+    Returns
+    -------
+    DataFrame
+        The index as a DataFrame with a datetime index.
+    """
+    if file_path.endswith('.parquet'):
+        df = pd.read_parquet(file_path, columns=columns)
+    elif file_path.endswith('.arrows'):
+        table = _read_arrow_streams(file_path)
+        if columns is not None:
+            table = table.select(['date', *columns])
+        df = table.to_pandas().set_index('date')
+    elif file_path.endswith('.feather'):
+        columns = None if columns is None else ['date', *columns]
+        df = pd.read_feather(file_path, columns=columns).set_index('date')
+    else:
+        convert_options = csv.ConvertOptions(
+            column_types={'date': pa.timestamp('ns')},
+            include_columns=None if columns is None else ['date', *columns]
+        )
+        with open(file_path, 'rb') as f:
+            table = csv.read_csv(f, convert_options=convert_options)
+        df = table.to_pandas().set_index('date')
+    return df
+
+
+def _write_index_to_file(df, file_path):
+    """Write an index DataFrame to a Parquet, Arrow IPC stream, Feather or CSV file.
+
+    Parquet, Arrow IPC stream and Feather files are compressed with zstd.
+
+    Parameters
+    ----------
+    df : DataFrame
+        The index to write.
+    file_path : str
+        Path where the index file will be stored. The format is given by the file
+        extension.
+    """
+    df = df.rename_axis('date')
+    if file_path.endswith('.parquet'):
+        df.to_parquet(file_path, compression='zstd', compression_level=3)
+    elif file_path.endswith('.arrows'):
+        table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+        with open(file_path, 'wb') as f:
+            _write_arrow_stream(table, f)
+    elif file_path.endswith('.feather'):
+        df.reset_index().to_feather(file_path, compression='zstd')
+    else:
+        table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+        # The index is daily, so write plain dates instead of full timestamps
+        table = table.set_column(0, 'date', table['date'].cast(pa.date32()))
+        write_options = csv.WriteOptions(quoting_style='needed')
+        with open(file_path, 'wb') as f:
+            csv.write_csv(table, f, write_options=write_options)
+
+
+def _append_to_arrow_stream_file(df, file_path):
+    """Append index rows to an Arrow IPC stream file without rewriting it.
+
+    The rows are written as a new stream at the end of the file, using the schema
+    of the existing data, so appending only costs the size of the new rows.
+
+    Parameters
+    ----------
+    df : DataFrame
+        The index rows to append, with the same columns as the index file.
+    file_path : str
+        Path to the Arrow IPC stream index file.
+    """
+    if len(df) == 0:
+        return
+    with open(file_path, 'rb') as f:
+        schema = pa.ipc.open_stream(f).schema
+    df = df.rename_axis('date').reset_index()
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    with open(file_path, 'ab') as f:
+        _write_arrow_stream(table, f)
+
+
+def _write_arrow_stream(table, f):
+    """Write a table as a zstd-compressed Arrow IPC stream to an open file."""
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    with pa.ipc.new_stream(f, table.schema, options=options) as writer:
+        writer.write_table(table)
+
+
+def _read_arrow_streams(file_path):
+    """Read and concatenate all Arrow IPC streams written one after another to a file."""
+    file_size = os.path.getsize(file_path)
+    tables = []
+    with open(file_path, 'rb') as f:
+        while f.tell() < file_size:
+            tables.append(pa.ipc.open_stream(f).read_all())
+    return pa.concat_tables(tables)
+
+
+def _convert_classified_files(file_paths, today, num_processes=1, cache_folder=None):
+    """Convert Feather files of classified headlines into index DataFrames.
+
+    Each file is converted independently, so with more than one process the files
+    are spread over a process pool. Otherwise the files are read concurrently in
+    threads and converted in the main process.
+
+    Parameters
+    ----------
+    file_paths : list
+        Paths to the Feather files.
+    today : Timestamp
+        Today's date. Data from today is dropped since it is incomplete.
+    num_processes : int, optional
+        The number of processes to use. Default is 1.
+    cache_folder : str, optional
+        Path to a folder of cached index DataFrames of past months. Files with an
+        up to date cache are not converted again. Default is None, i.e. no cache.
+
+    Yields
+    ------
+    DataFrame
+        Index DataFrame of each file with data, in the same order as `file_paths`.
+    """
+    cached_dfs = [_read_cached_index(f, cache_folder) for f in file_paths]
+    files_to_convert = [f for f, df in zip(file_paths, cached_dfs) if df is None]
+    converted_dfs = _convert_files(files_to_convert, today, num_processes)
+
+    for file_path, df in zip(file_paths, cached_dfs):
+        if df is None:
+            df = next(converted_dfs)
+            if (cache_folder is not None and df is not None
+                    and _is_past_month(file_path, today)):
+                _write_cached_index(df, file_path, cache_folder)
+        if df is not None:
+            yield df
+
+
+def _convert_files(file_paths, today, num_processes):
+    """Convert the files into index DataFrames, yielding None for empty files."""
+    if num_processes > 1:
+        convert_file = functools.partial(_convert_classified_file, today=today)
+        with ProcessPoolExecutor(
+            max_workers=num_processes,
+            # Importing newsindex imports classify and with it torch, whose thread
+            # pools may already be running in this process and can deadlock if forked
+            mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            yield from executor.map(convert_file, file_paths, chunksize=16)
+    else:
+        for classified_headlines in _read_classified_files(file_paths):
+            yield convert_headlines_df_to_index(classified_headlines, today)
+
+
+def _convert_classified_file(file_path, today):
+    """Read a Feather file of classified headlines and convert it into the index."""
+    return convert_headlines_df_to_index(_read_classified_file(file_path), today)
+
+
+def _read_cached_index(file_path, cache_folder):
+    """Read the cached index DataFrame of a file of classified headlines.
+
+    Returns None if there is no cache, or if the file has been changed since the
+    cache was written.
+    """
+    if cache_folder is None:
+        return None
+    cache_path = _cache_path(file_path, cache_folder)
+    if not os.path.exists(cache_path):
+        return None
+    if os.path.getmtime(cache_path) < os.path.getmtime(file_path):
+        return None
+    return pd.read_parquet(cache_path)
+
+
+def _write_cached_index(df, file_path, cache_folder):
+    """Write the index DataFrame of a file of classified headlines to the cache."""
+    os.makedirs(cache_folder, exist_ok=True)
+    df.to_parquet(_cache_path(file_path, cache_folder))
+
+
+def _cache_path(file_path, cache_folder):
+    """Get the path of the cached index DataFrame of a file of classified headlines."""
+    month = _file_to_month(os.path.basename(file_path))
+    return os.path.join(cache_folder, f'{month}.parquet')
+
+
+def _is_past_month(file_path, today):
+    """Check whether the file is from a month before the current one.
+
+    Only past months are cached, since data is still being added to the current
+    month and today's data is dropped from its index.
+    """
+    return _file_to_month(os.path.basename(file_path)) < today.strftime('%Y-%m')
+
+
+def _read_classified_files(file_paths):
+    """Read Feather files of classified headlines concurrently.
+
+    Parameters
+    ----------
+    file_paths : list
+        Paths to the Feather files.
+
+    Yields
+    ------
+    DataFrame
+        DataFrame of classified 'Economics' headlines indexed by publication date,
+        in the same order as `file_paths`.
+    """
+    with ThreadPoolExecutor() as executor:
+        yield from executor.map(_read_classified_file, file_paths)
+
+
+def _read_classified_file(file_path):
+    """Read a Feather file of classified headlines.
+
+    Headlines not classified as 'Economics' are dropped while the data is still in
+    Arrow format, so they are never converted to Python objects. The label columns
+    are read as categoricals, also from files that store them as plain strings.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the Feather file.
+
+    Returns
+    -------
+    DataFrame
+        DataFrame of classified 'Economics' headlines indexed by publication date.
+    """
+    with open(file_path, 'rb') as f:
+        table = feather.read_table(f)
+    table = table.filter(pc.equal(table['model topic'], 'Economics'))
+    for name in ['model topic', 'sentiment']:
+        column = table[name]
+        if not pa.types.is_dictionary(column.type):
+            i = table.schema.get_field_index(name)
+            table = table.set_column(i, name, pc.dictionary_encode(column))
+    return table.to_pandas().set_index('date')
 
 
 def files_missing_in_index(input_folder, append_start_date):
@@ -93,7 +399,7 @@ def files_missing_in_index(input_folder, append_start_date):
     Parameters
     ----------
     input_folder : str
-        Path to the folder containing the input CSV files.
+        Path to the folder containing the input Feather files.
     append_start_date : datetime
         The starting date for the files that will be appended.
 
@@ -102,48 +408,46 @@ def files_missing_in_index(input_folder, append_start_date):
     list
         List of file names that are missing in the index.
     """
-    files = os.listdir(input_folder)
-    files = [f for f in files if f.endswith(".csv")]
-    month_start = append_start_date.replace(day=1)
-    files = [f for f in files if _file_to_dtime(f) >= month_start]
-    return files
+    files = _list_classified_files(input_folder)
+    # File names start with the ISO year and month, so they sort chronologically
+    months = [_file_to_month(f) for f in files]
+    month_start = append_start_date.strftime('%Y-%m')
+    return files[bisect.bisect_left(months, month_start):]
 
 
-def _file_to_dtime(file_name):
-    """Convert the date string in a file name to a datetime object.
-    The datetime object is the first day of the month given in the file name.
+def _list_classified_files(folder):
+    """Get the sorted names of the Feather files in a folder."""
+    with os.scandir(folder) as entries:
+        return sorted(entry.name for entry in entries if entry.name.endswith(".feather"))
 
-    Parameters
-    ----------
-    file_name : str
-        The name of the file to be converted.
 
-    Returns
-    -------
-    datetime
-        The datetime object corresponding to the file name.
-    """
-    date_str = file_name.split('.')[0]
-    return pd.to_datetime(date_str)
+def _file_to_month(file_name):
+    """Get the 'YYYY-MM' month string from a file name."""
+    return file_name.split('.')[0]
 
 
-def convert_headlines_df_to_index(classified_headlines):
+def convert_headlines_df_to_index(classified_headlines, today=None):
     """Convert a DataFrame of classified headlines into an index DataFrame.
 
     Parameters
     ----------
     classified_headlines : pd.DataFrame
         DataFrame of headlines with sentiment and topic labels.
+    today : pd.Timestamp, optional
+        Today's date, whose incomplete data is dropped. Determined from the system
+        clock if not given.
 
     Returns
     -------
     DataFrame or None
         Formatted DataFrame if successful, None if an error occurs.
     """
+    if today is None:
+        today = pd.Timestamp.today().floor('D')
     try:
         classified_headlines = _filter_headlines(classified_headlines)
         df = _format_to_index(classified_headlines)
-        df = _drop_today_if_in_df(df)  # To avoid writing incomplete data
+        df = _drop_today_if_in_df(df, today)  # To avoid writing incomplete data
         return df
     except AttributeError:  # If file is empty
         return None
@@ -162,9 +466,19 @@ def _filter_headlines(df):
     DataFrame
         The filtered DataFrame.
     """
-    df = df[df['model topic'] == 'Economics']
-    # drop headlines with less than 3 words
-    df = df[df['headline'].str.split().str.len() >= 3]
+    keep = (df['model topic'] == 'Economics').to_numpy(dtype=bool, na_value=False)
+    # drop headlines with less than 3 words, only checking the 'Economics' ones
+    if 'word count' in df.columns:
+        keep &= df['word count'].to_numpy() >= 3
+    else:  # Classified before word counts were stored
+        headlines = df['headline'].to_numpy(dtype=object)[keep]
+        # Splitting at most twice is enough to tell whether there is a third word
+        keep[keep] = np.fromiter(
+            (isinstance(h, str) and len(h.split(None, 2)) == 3 for h in headlines),
+            dtype=bool,
+            count=len(headlines)
+        )
+    df = df[keep]
     return df
 
 
@@ -187,9 +501,17 @@ def _format_to_index(df):
 
     df.index.name = 'date'
     df = __count_num_labels_per_day(df)
-    df['total'] = df.sum(axis=1)
-    df['index_value'] = (
-        (df['positive'] - df['negative']) / (df['positive'] + df['negative'])
+    negative = df['negative'].to_numpy()
+    positive = df['positive'].to_numpy()
+    df['total'] = negative + df['neutral'].to_numpy() + positive
+    # Days without positive or negative headlines get no index value here, it is
+    # filled in with the rolling mean when resampling
+    num_polar = positive + negative
+    df['index_value'] = np.divide(
+        positive - negative,
+        num_polar,
+        out=np.full(len(df), np.nan),
+        where=num_polar > 0
     )
     df = __resample_to_day(df, index_col='index_value')
     return df
@@ -209,16 +531,15 @@ def __count_num_labels_per_day(df):
         DataFrame with date as index and counts of negative, neutral, and positive
         labels as columns.
     """
-    df = df['sentiment'].groupby(df.index.date).value_counts().unstack()
-    df = df.fillna(0)
-    for col in ['Negative', 'Neutral', 'Positive']:
-        if col not in df.columns:
-            df[col] = 0
-        else:
-            df[col] = df[col].astype(int)
-    df = df[['Negative', 'Neutral', 'Positive']]
-    df.columns = ['negative', 'neutral', 'positive']
-    return df.sort_index()
+    day_codes, days = pd.factorize(df.index.normalize(), sort=True)
+    labels = ['Negative', 'Neutral', 'Positive']
+    label_codes = pd.Categorical(df['sentiment'], categories=labels).codes
+    # Count each (day, label) pair in a single bincount, skipping unknown labels
+    is_known = label_codes >= 0
+    flat_codes = day_codes[is_known] * len(labels) + label_codes[is_known]
+    counts = np.bincount(flat_codes, minlength=len(days) * len(labels))
+    counts = counts.reshape(len(days), len(labels))
+    return pd.DataFrame(counts, index=days, columns=['negative', 'neutral', 'positive'])
 
 
 def __resample_to_day(df, index_col):
@@ -236,17 +557,16 @@ def __resample_to_day(df, index_col):
     DataFrame
         The resampled DataFrame.
     """
-    df.index = pd.DatetimeIndex(df.index)
+    # Already one row per day, so only the missing days have to be inserted
+    df = df.asfreq('D')
+    count_cols = df.columns.drop(index_col)
+    df[count_cols] = df[count_cols].fillna(0).astype('int64')
     sma = df[index_col].rolling(365, min_periods=1).mean()
-    sma = sma.resample('D').ffill()
-
-    df = df.resample('D').mean()
-    df[index_col] = df[index_col].fillna(sma)
-    df = df.fillna(0)
+    df[index_col] = df[index_col].fillna(sma).fillna(0)
     return df
 
 
-def _drop_today_if_in_df(df):
+def _drop_today_if_in_df(df, today):
     """Drop today's data from the DataFrame if it exists.
 
     Parameters
@@ -254,14 +574,16 @@ def _drop_today_if_in_df(df):
     df : DataFrame
         The DataFrame from which today's data
     should be dropped if it exists.
+    today : pd.Timestamp
+        Today's date.
 
     Returns
     -------
     DataFrame
         The DataFrame with today's data possibly dropped.
     """
-    today = pd.Timestamp.today().floor('D')
-    latest_day_is_today = df.index[-1] == today
+    # Compare the raw datetime64 values to skip building a Timestamp for the last day
+    latest_day_is_today = len(df) > 0 and df.index.values[-1] == today.to_datetime64()
     if latest_day_is_today:
         df = df.iloc[:-1]
     return df
@@ -273,15 +595,33 @@ def add_smoothed_col_to_index_df(index_path):
     Parameters
     ----------
     index_path : str
-        Path to the index CSV file.
+        Path to the index file.
 
     Returns
     -------
     DataFrame
         DataFrame with an added column of smoothed index values.
     """
-    index_df = pd.read_csv(index_path, index_col=0, parse_dates=True)
-    index_df = index_df[['negative', 'neutral', 'positive', 'total', 'index_value']]
+    index_df = _read_index_file(
+        index_path,
+        columns=['negative', 'neutral', 'positive', 'total', 'index_value']
+    )
+    return _add_smoothed_col(index_df)
+
+
+def _add_smoothed_col(index_df):
+    """Add a column of smoothed index values to an index DataFrame in memory.
+
+    Parameters
+    ----------
+    index_df : DataFrame
+        The index, with an 'index_value' column.
+
+    Returns
+    -------
+    DataFrame
+        The same DataFrame with an added column of smoothed index values.
+    """
     smoothed_index = __calculate_smoothed_index(index_df['index_value'])
     index_df['smoothed_index_value'] = smoothed_index
     index_df.index.name = 'date'
@@ -304,7 +644,51 @@ def __calculate_smoothed_index(index_series):
         The series with the calculated index values.
     """
     TEN_YEARS = 365 * 10
-    smoothed_df = index_series.ewm(span=100).mean()
-    trend_df = index_series.rolling(TEN_YEARS).mean()
-    index = smoothed_df - trend_df + 0.5  # Detrended index
+    values = index_series.to_numpy(dtype=np.float64)
+    index = _smooth_and_detrend(values, span=100, window=TEN_YEARS)
+    return pd.Series(index, index=index_series.index, name=index_series.name)
+
+
+@njit(cache=True)
+def _smooth_and_detrend(values, span, window):
+    """Subtract a rolling mean trend from an exponential moving average in one pass.
+
+    Gives the same result as ``ewm(span=span).mean() - rolling(window).mean() + 0.5``
+    in pandas, including the handling of NaN values.
+
+    Parameters
+    ----------
+    values : ndarray
+        The values to smooth and detrend.
+    span : int
+        The span of the exponential moving average.
+    window : int
+        The window size of the rolling mean used as trend.
+
+    Returns
+    -------
+    ndarray
+        The smoothed and detrended values.
+    """
+    decay = 1 - 2 / (span + 1)
+    index = np.empty(len(values))
+    ema_sum = ema_weight = 0.0
+    window_sum = 0.0
+    window_count = 0
+    for i in range(len(values)):
+        ema_sum *= decay
+        ema_weight *= decay
+        if not np.isnan(values[i]):
+            ema_sum += values[i]
+            ema_weight += 1
+            window_sum += values[i]
+            window_count += 1
+        if i >= window and not np.isnan(values[i - window]):
+            window_sum -= values[i - window]
+            window_count -= 1
+
+        if window_count == window and ema_weight > 0:
+            index[i] = ema_sum / ema_weight - window_sum / window + 0.5
+        else:
+            index[i] = np.nan
     return index
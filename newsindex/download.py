@@ -1,6 +1,7 @@
 import os
 import datetime
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 from pynytimes import NYTAPI
@@ -18,7 +19,8 @@ def nyt_download_history(
     start_year=1900,
     output_folder=NYT_OUTPUT_PATH,
     overwrite=False,
-    warn=False
+    warn=False,
+    num_threads=4
 ):
     """Download historical New York Times headlines starting from a specified year.
 
@@ -36,23 +38,15 @@ def nyt_download_history(
     warn : bool, optional
         If True, issue a warning when a file already exists and is not overwritten.
         Default is False.
+    num_threads : int, optional
+        The number of months to download concurrently. Default is 4.
     """
     os.makedirs(NYT_OUTPUT_PATH, exist_ok=True)
-    end_year = datetime.datetime.now().year
-    for year in range(start_year, end_year + 1):
-        for month in range(1, 13):
-            if datetime.datetime(year, month, 1) > datetime.datetime.now():
-                break
-            try:
-                _download_nyt_headlines_for_month(
-                    month, year, output_folder, overwrite=overwrite
-                )
-            except FileExistsError:
-                if warn:
-                    warnings.warn(f'{year}-{month:02d} already downloaded, skipping...')
+    months = _months_until_now(start_year, start_month=1)
+    _download_months(months, output_folder, overwrite, warn, num_threads)
 
 
-def nyt_download_latest(output_folder=NYT_OUTPUT_PATH):
+def nyt_download_latest(output_folder=NYT_OUTPUT_PATH, num_threads=4):
     """Download the latest historical New York Times headlines.
 
     Note: API is limited to 500 requests per day, i.e. 500 months.
@@ -62,23 +56,70 @@ def nyt_download_latest(output_folder=NYT_OUTPUT_PATH):
     output_folder : str, optional
         The path to the folder where the downloaded files will be saved.
         Default is 'data/raw-nyt-data'.
+    num_threads : int, optional
+        The number of months to download concurrently. Default is 4.
     """
-    last_file = os.listdir(NYT_OUTPUT_PATH)[-1]
+    with os.scandir(output_folder) as entries:
+        last_file = max((entry.name for entry in entries if entry.name.endswith('.csv')),
+                        default=None)
+    if last_file is None:
+        raise FileNotFoundError(f'No downloaded headlines found in {output_folder}, '
+                                'use nyt_download_history to download them first.')
 
     start_year = int(last_file[:4])
     start_month = int(last_file[5:7])
 
-    end_year = datetime.datetime.now().year
-    end_month = datetime.datetime.now().month
+    months = _months_until_now(start_year, start_month)
+    _download_months(months, output_folder, overwrite=True, num_threads=num_threads)
+
+
+def _months_until_now(start_year, start_month):
+    """Get the (year, month) pairs from the given month up to the current month."""
+    start = datetime.datetime(start_year, start_month, 1)
+    month_starts = pd.date_range(start, datetime.datetime.now(), freq='MS')
+    return [(d.year, d.month) for d in month_starts]
 
-    for year in range(start_year, end_year + 1):
-        start_month = 1 if year > start_year else start_month
-        for month in range(start_month, 13):
-            _download_nyt_headlines_for_month(
-                month, year, output_folder, overwrite=True
-            )
-            if year == end_year and month == end_month:
-                break
+
+def _download_months(months, output_folder, overwrite=False, warn=False, num_threads=4):
+    """Download New York Times headlines for several months concurrently.
+
+    The downloads are bound by the latency of the API, so they run in a pool of
+    threads. Requests that hit the API rate limit are retried with backoff by
+    pynytimes. If a download fails, e.g. when the daily request limit is reached,
+    the months not yet started are cancelled and the error is raised.
+
+    Parameters
+    ----------
+    months : list of tuple
+        The (year, month) pairs for which to download headlines.
+    output_folder : str
+        The path to the folder where the downloaded files will be saved.
+    overwrite : bool, optional
+        If True, overwrite existing files. Default is False.
+    warn : bool, optional
+        If True, issue a warning when a file already exists and is not overwritten.
+        Default is False.
+    num_threads : int, optional
+        The number of months to download concurrently. Default is 4.
+    """
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = [
+            executor.submit(_download_nyt_headlines_for_month,
+                            month, year, output_folder, overwrite=overwrite)
+            for year, month in months
+        ]
+        # Handle the results in the main thread, in the order of the months
+        for (year, month), future in zip(months, futures):
+            try:
+                future.result()
+            except FileExistsError:
+                if warn:
+                    warnings.warn(f'{year}-{month:02d} already downloaded, skipping...')
+            except Exception:
+                # Don't keep calling the API for the remaining months
+                for queued_future in futures:
+                    queued_future.cancel()
+                raise
 
 
 def _download_nyt_headlines_for_month(month, year, output_folder, overwrite=False):
@@ -122,19 +163,16 @@ def __get_nyt_headlines(date):
 
     Returns
     -------
-    list
-        A list of tuples, each containing the publication date, headline, and
-        news desk of an article.
+    dict
+        A dict with lists of the publication dates, headlines and news desks of
+        the articles, under the keys 'date', 'headline' and 'topic'.
     """
     articles = nytapi.archive_metadata(date)
-    headlines = []
+    headlines = {"date": [], "headline": [], "topic": []}
     for article in articles:
-        row = (
-            article["pub_date"],
-            article["headline"]["main"],
-            article['news_desk'],
-        )
-        headlines.append(row)
+        headlines["date"].append(article["pub_date"])
+        headlines["headline"].append(article["headline"]["main"])
+        headlines["topic"].append(article['news_desk'])
     return headlines
 
 
@@ -143,18 +181,20 @@ def __format_headlines(headlines):
 
     Parameters
     ----------
-    headlines : list
-        A list of tuples, each containing the publication date, headline,
-        and news desk of an article.
+    headlines : dict
+        A dict with lists of the publication dates, headlines and news desks of
+        the articles, under the keys 'date', 'headline' and 'topic'.
 
     Returns
     -------
     DataFrame
         A DataFrame containing the formatted headlines data.
     """
-    df = pd.DataFrame(headlines, columns=["date", "headline", "topic"])
-    df = df.set_index("date")
-    df.index = pd.DatetimeIndex(df.index)
-    df.index = df.index.tz_localize(None)
-    df["headline"] = df["headline"].str.replace("\n", " ")
+    index = pd.DatetimeIndex(headlines["date"], name="date").tz_localize(None)
+    df = pd.DataFrame(
+        {"headline": headlines["headline"], "topic": headlines["topic"]},
+        index=index,
+        dtype=object
+    )
+    df["headline"] = df["headline"].str.replace(r"[\r\n]", " ", regex=True)
     return df.sort_index()
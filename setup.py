@@ -10,9 +10,11 @@ setup(
     python_requires='>=3.8',
     packages=find_packages(exclude=['tests', 'data']),
     install_requires=[
-        'pandas>=1.4.0',
+        'numba',
+        'pandas>=2.0.0',
+        'pyarrow',
         'pynytimes',
         'torch',
-        'transformers',
+        'transformers>=4.56',
     ],
 )
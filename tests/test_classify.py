@@ -1,25 +1,55 @@
-from .fixtures import _fs_read_file, RAW_DATA_PATH, CLASSIFIED_DATA_PATH
+from .fixtures import RAW_DATA_PATH, CLASSIFIED_DATA_PATH
 
+from io import StringIO
+from types import SimpleNamespace
+import numpy as np
+import pytest
 import pandas as pd
-from newsindex.classify import ClassificationPipeline, classify_latest, classify_full_history
+import newsindex.classify
+from newsindex.classify import (
+    ClassificationPipeline,
+    classify_latest,
+    classify_full_history,
+    _get_model,
+    _model_version,
+    _PredictionCache
+)
 
 FILES = ['2022-01.csv', '2022-02.csv', '2022-03.csv']
+CLASSIFIED_FILES = ['2022-01.feather', '2022-02.feather', '2022-03.feather']
 
 
 def mock_model_class_and_cuda(mocker):
-    """Mocks the _Model class, its predict method and the torch.cuda.is_available function"""
+    """Mocks the _Model and _Tokenizer classes, their methods and the
+    torch.cuda.is_available function, and returns the mocked _Model.predict
+    """
+    def mocked_init(self, model_name, device=None, quantize=False):
+        self.labels = ['test']
+        self.version = f'{model_name}+int8' if quantize else model_name
+
     def mocked_predict(_, texts):
         if isinstance(texts, str):
-            return ['test']
+            return np.zeros(1, dtype=np.int8)
         else:
-            return ['test'] * len(texts)
+            return np.zeros(len(texts), dtype=np.int8)
+
+    def mocked_tokenize(_, texts):
+        return texts
 
     mock_model_predict = mocker.patch('newsindex.classify._Model.predict', autospec=True)
     mock_model_predict.side_effect = mocked_predict
     mock_model_init = mocker.patch('newsindex.classify._Model.__init__', autospec=True)
-    mock_model_init.return_value = None
+    mock_model_init.side_effect = mocked_init
+    mock_tokenizer_call = mocker.patch('newsindex.classify._Tokenizer.__call__',
+                                       autospec=True)
+    mock_tokenizer_call.side_effect = mocked_tokenize
+    mock_tokenizer_init = mocker.patch('newsindex.classify._Tokenizer.__init__',
+                                       autospec=True)
+    mock_tokenizer_init.return_value = None
     mock_cuda_is_available = mocker.patch('torch.cuda.is_available', autospec=True)
     mock_cuda_is_available.return_value = False
+    _get_model.cache_clear()  # Don't reuse models loaded before mocking
+    return mock_model_predict
 
 
 def test_predict_single_string(mocker):
@@ -29,8 +59,8 @@ def test_predict_single_string(mocker):
     text = "US economy grows by 6.4% in first quarter"
     expected = pd.DataFrame({
         'headline': [text],
-        'model topic': ['test'],
-        'sentiment': ['test']
+        'model topic': pd.Categorical(['test']),
+        'sentiment': pd.Categorical(['test'])
     })
     # Act
     result = ClassificationPipeline().predict(text)
@@ -48,8 +78,8 @@ def test_predict_list_of_strings(mocker):
     ]
     expected = pd.DataFrame({
         'headline': texts,
-        'model topic': ['test', 'test'],
-        'sentiment': ['test', 'test']
+        'model topic': pd.Categorical(['test', 'test']),
+        'sentiment': pd.Categorical(['test', 'test'])
     })
     # Act
     result = ClassificationPipeline().predict(texts)
@@ -70,8 +100,8 @@ def test_predict_dataframe(mocker, fs):
     expected = pd.DataFrame({
         'headline': texts,
         'topic': ['topic', 'topic'],
-        'model topic': ['test', 'test'],
-        'sentiment': ['test', 'test']
+        'model topic': pd.Categorical(['test', 'test']),
+        'sentiment': pd.Categorical(['test', 'test'])
     })
     expected.index = pd.DatetimeIndex(['2022-01-01', '2022-01-02'])
     # Act
@@ -80,6 +110,155 @@ def test_predict_dataframe(mocker, fs):
     assert result.equals(expected)
 
 
+def test_predict_with_cache(mocker, tmp_path):
+    """Tests if cached headlines are not classified by the models again"""
+    # Arrange
+    mock_model_predict = mock_model_class_and_cuda(mocker)
+
+    cache_path = str(tmp_path / 'predictions.sqlite')
+    ClassificationPipeline(cache_path=cache_path).predict(['headline1', 'headline2'])
+    mock_model_predict.reset_mock()
+
+    texts = ['headline2', 'headline3']
+    expected = pd.DataFrame({
+        'headline': texts,
+        'model topic': pd.Categorical(['test', 'test']),
+        'sentiment': pd.Categorical(['test', 'test'])
+    })
+    # Act
+    result = ClassificationPipeline(cache_path=cache_path).predict(texts)
+    # Assert
+    assert result.equals(expected)
+    assert [call.args[1] for call in mock_model_predict.call_args_list] == [
+        ['headline3'], ['headline3']
+    ]
+
+
+def test_predict_with_cache_from_other_models(mocker, tmp_path):
+    """Tests if labels cached by differently configured models are not reused"""
+    # Arrange
+    mock_model_predict = mock_model_class_and_cuda(mocker)
+
+    cache_path = str(tmp_path / 'predictions.sqlite')
+    texts = ['headline1', 'headline2']
+    ClassificationPipeline(cache_path=cache_path, quantize=True).predict(texts)
+    mock_model_predict.reset_mock()
+    # Act
+    ClassificationPipeline(cache_path=cache_path).predict(texts)
+    # Assert
+    assert [call.args[1] for call in mock_model_predict.call_args_list] == [
+        texts, texts
+    ]
+
+
+def test_prediction_cache_key_depends_on_quantization(tmp_path):
+    """Tests if the cache keys of quantized models differ from those of full
+    precision models"""
+    # Arrange
+    def make_model(version):
+        return SimpleNamespace(version=version, labels=['test'])
+
+    cache_path = str(tmp_path / 'predictions.sqlite')
+    version = 'hakonmh/topic-xdistil-uncased@abc'
+    cache = _PredictionCache(cache_path, [make_model(version)])
+    quantized_cache = _PredictionCache(cache_path, [make_model(f'{version}+int8-torch.ao')])
+    # Act & Assert
+    assert cache.hash('headline') != quantized_cache.hash('headline')
+
+
+def test_model_version_of_local_model_depends_on_weights(tmp_path):
+    """Tests if models loaded from a local folder are versioned by their files"""
+    # Arrange
+    config = SimpleNamespace(_commit_hash=None)
+    (tmp_path / 'config.json').write_text('{}')
+    (tmp_path / 'model.safetensors').write_bytes(b'weights')
+    version = _model_version(str(tmp_path), config)
+    (tmp_path / 'model.safetensors').write_bytes(b'retrained weights')
+    # Act
+    retrained_version = _model_version(str(tmp_path), config)
+    # Assert
+    assert version is not None
+    assert retrained_version != version
+    assert _model_version('model', SimpleNamespace(_commit_hash='abc')) == 'model@abc'
+
+
+def test_predict_without_cache_if_model_version_unknown(mocker, tmp_path):
+    """Tests if predictions of models with an unknown version are not cached"""
+    # Arrange
+    mock_model_class_and_cuda(mocker)
+    mocker.patch('newsindex.classify._get_model',
+                 return_value=SimpleNamespace(version=None, labels=['test']))
+    assert _model_version('model', SimpleNamespace(_commit_hash=None)) is None
+    cache_path = tmp_path / 'predictions.sqlite'
+    # Act
+    with pytest.warns(UserWarning):
+        pipeline = ClassificationPipeline(cache_path=str(cache_path))
+    # Assert
+    assert pipeline.cache is None
+    assert not cache_path.exists()
+
+
+def test_classify_full_history_quantize(mocker, fs):
+    """Tests if classify_full_history passes quantize on to the models"""
+    # Arrange
+    mock_model_class_and_cuda(mocker)
+    spy_get_model = mocker.spy(newsindex.classify, '_get_model')
+
+    _create_and_write_raw_data(fs)
+    # Act
+    classify_full_history(RAW_DATA_PATH, CLASSIFIED_DATA_PATH, quantize=True)
+    # Assert
+    assert spy_get_model.call_count == 2
+    assert all(call.args[2] is True for call in spy_get_model.call_args_list)
+
+
+def test_classify_full_history_quantize_in_processes(mocker, fs):
+    """Tests if classify_full_history passes quantize on to the worker processes"""
+    # Arrange
+    mock_model_class_and_cuda(mocker)
+    mock_executor = mocker.patch('newsindex.classify.ProcessPoolExecutor')
+
+    _create_and_write_raw_data(fs)
+    # Act
+    classify_full_history(RAW_DATA_PATH, CLASSIFIED_DATA_PATH, num_processes=2,
+                          quantize=True)
+    # Assert
+    assert mock_executor.call_args.kwargs['initargs'][-1] is True
+
+
+def test_predict_batches_sorted_by_length(mocker):
+    """Tests if texts are batched in order of length and the labels are returned
+    in the original order
+    """
+    # Arrange
+    mock_model_predict = mock_model_class_and_cuda(mocker)
+
+    def mocked_predict(_, texts):
+        return np.array([len(text) > 5 for text in texts], dtype=np.int8)
+
+    mock_model_predict.side_effect = mocked_predict
+    pipeline = ClassificationPipeline(batch_size=2)
+    pipeline.topic_model.labels = ['short', 'long']
+    pipeline.sentiment_model.labels = ['short', 'long']
+
+    texts = ['a long text', 'short', 'a longer text', 'tiny']
+    expected = pd.DataFrame({
+        'headline': texts,
+        'model topic': pd.Categorical(['long', 'short', 'long', 'short'],
+                                      categories=['short', 'long']),
+        'sentiment': pd.Categorical(['long', 'short', 'long', 'short'],
+                                    categories=['short', 'long'])
+    })
+    # Act
+    result = pipeline.predict(texts)
+    # Assert
+    assert result.equals(expected)
+    assert [call.args[1] for call in mock_model_predict.call_args_list] == [
+        ['tiny', 'short'], ['tiny', 'short'],
+        ['a long text', 'a longer text'], ['a long text', 'a longer text']
+    ]
+
+
 def test_classify_full_history_overwrite(mocker, fs):
     """Tests if classify_full_history correctly overwrites all files in the
     classified-data dir when overwrite=True
@@ -97,8 +276,9 @@ def test_classify_full_history_overwrite(mocker, fs):
     # Act
     classify_full_history(RAW_DATA_PATH, CLASSIFIED_DATA_PATH, overwrite=True)
     # Assert
-    assert fs.listdir(CLASSIFIED_DATA_PATH) == FILES
-    _assert_file_contents_equal(CLASSIFIED_DATA_PATH, FILES, expected_file_contents)
+    assert fs.listdir(CLASSIFIED_DATA_PATH) == CLASSIFIED_FILES
+    _assert_file_contents_equal(CLASSIFIED_DATA_PATH, CLASSIFIED_FILES,
+                                expected_file_contents)
 
 
 def test_classify_full_history_not_overwrite(mocker, fs):
@@ -118,8 +298,31 @@ def test_classify_full_history_not_overwrite(mocker, fs):
     # Act
     classify_full_history(RAW_DATA_PATH, CLASSIFIED_DATA_PATH, overwrite=False)
     # Assert
-    assert fs.listdir(CLASSIFIED_DATA_PATH) == FILES
-    _assert_file_contents_equal(CLASSIFIED_DATA_PATH, FILES, expected_file_contents)
+    assert fs.listdir(CLASSIFIED_DATA_PATH) == CLASSIFIED_FILES
+    _assert_file_contents_equal(CLASSIFIED_DATA_PATH, CLASSIFIED_FILES,
+                                expected_file_contents)
+
+
+def test_classify_full_history_with_carriage_return_in_headline(mocker, fs):
+    """Tests if rows broken up by an unquoted carriage return in a headline are
+    skipped instead of failing the classification
+    """
+    # Arrange
+    mock_model_class_and_cuda(mocker)
+
+    fs.create_dir(RAW_DATA_PATH)
+    raw_file_content = __create_raw_file_content(num_rows=3)
+    raw_file_content = raw_file_content.replace('01 00:00:00,headline',
+                                                '01 00:00:00,head\rline', 1)
+    fs.create_file(f'{RAW_DATA_PATH}/{FILES[0]}', contents=raw_file_content)
+    expected_file_content = __create_classified_file_content(num_rows=3)
+    expected_file_content = ''.join(expected_file_content.splitlines(True)[:1] +
+                                    expected_file_content.splitlines(True)[2:])
+    # Act
+    classify_full_history(RAW_DATA_PATH, CLASSIFIED_DATA_PATH)
+    # Assert
+    _assert_file_contents_equal(CLASSIFIED_DATA_PATH, CLASSIFIED_FILES[:1],
+                                [expected_file_content])
 
 
 def test_classify_latest(mocker, fs):
@@ -139,8 +342,46 @@ def test_classify_latest(mocker, fs):
     # Act
     classify_latest(RAW_DATA_PATH, CLASSIFIED_DATA_PATH)
     # Assert
-    assert fs.listdir(CLASSIFIED_DATA_PATH) == FILES
-    _assert_file_contents_equal(CLASSIFIED_DATA_PATH, FILES, expected_file_contents)
+    assert fs.listdir(CLASSIFIED_DATA_PATH) == CLASSIFIED_FILES
+    _assert_file_contents_equal(CLASSIFIED_DATA_PATH, CLASSIFIED_FILES,
+                                expected_file_contents)
+
+
+def test_classify_latest_only_new_headlines(mocker, fs):
+    """Tests if classify_latest only runs the models on the headlines missing from
+    the latest classified file
+    """
+    # Arrange
+    mock_model_predict = mock_model_class_and_cuda(mocker)
+
+    _create_and_write_raw_data(fs)
+    _create_and_write_classified_data(fs)
+    # Act
+    classify_latest(RAW_DATA_PATH, CLASSIFIED_DATA_PATH)
+    # Assert
+    num_texts = [len(call.args[1]) for call in mock_model_predict.call_args_list]
+    assert num_texts == [1, 1, 3, 3]
+
+
+def test_classify_latest_converts_csv_classified_files(mocker, fs):
+    """Tests if classified CSV files from earlier versions are converted to Feather
+    files instead of being classified again
+    """
+    # Arrange
+    mock_model_predict = mock_model_class_and_cuda(mocker)
+
+    _create_and_write_raw_data(fs)
+    classified_file_content, _ = _create_and_write_classified_data(fs)
+    fs.remove(f'{CLASSIFIED_DATA_PATH}/2022-01.feather')
+    csv_file_content = classified_file_content.replace(',word count', '')
+    csv_file_content = csv_file_content.replace(',1\n', '\n')
+    fs.create_file(f'{CLASSIFIED_DATA_PATH}/2022-01.csv', contents=csv_file_content)
+    # Act
+    classify_latest(RAW_DATA_PATH, CLASSIFIED_DATA_PATH)
+    # Assert
+    assert mock_model_predict.call_count == 4  # 2022-02 and 2022-03, not 2022-01
+    _assert_file_contents_equal(CLASSIFIED_DATA_PATH, CLASSIFIED_FILES[:1],
+                                [classified_file_content])
 
 
 def _create_and_write_raw_data(fs):
@@ -153,13 +394,12 @@ def _create_and_write_raw_data(fs):
 
 def __create_raw_file_content(num_rows=3):
     """Creates a string with the content for an unclassified data file"""
-    file_content = "date,headline,topic\n"
+    lines = ["date,headline,topic\n"]
     for i in range(num_rows):
         date = pd.Timestamp('2022-01-01') + pd.Timedelta(days=i)
         date = date.strftime('%Y-%m-%d 00:00:00')
-        line = f"{date},headline,none\n"
-        file_content += line
-    return file_content
+        lines.append(f"{date},headline,none\n")
+    return ''.join(lines)
 
 
 def _create_and_write_classified_data(fs):
@@ -170,25 +410,38 @@ def _create_and_write_classified_data(fs):
     classified_file_content = __create_classified_file_content(num_rows=3)
     partially_classified_file_content = __create_classified_file_content(num_rows=2)
 
-    fs.create_file(f'{CLASSIFIED_DATA_PATH}/2022-01.csv',
-                   contents=classified_file_content)
-    fs.create_file(f'{CLASSIFIED_DATA_PATH}/2022-02.csv',
-                   contents=partially_classified_file_content)
+    __write_classified_file(f'{CLASSIFIED_DATA_PATH}/2022-01.feather',
+                            classified_file_content)
+    __write_classified_file(f'{CLASSIFIED_DATA_PATH}/2022-02.feather',
+                            partially_classified_file_content)
     return classified_file_content, partially_classified_file_content
 
 
+def __write_classified_file(file_path, file_content):
+    """Writes the content of a classified data file to a Feather file"""
+    _csv_content_to_df(file_content).reset_index().to_feather(file_path)
+
+
 def __create_classified_file_content(num_rows=3):
     """Creates a string with the content for a classified data file"""
-    file_content = "date,headline,topic,model topic,sentiment\n"
+    lines = ["date,headline,topic,model topic,sentiment,word count\n"]
     for i in range(num_rows):
         date = pd.Timestamp('2022-01-01') + pd.Timedelta(days=i)
         date = date.strftime('%Y-%m-%d 00:00:00')
-        line = f"{date},headline,none,test,test\n"
-        file_content += line
-    return file_content
+        lines.append(f"{date},headline,none,test,test,1\n")
+    return ''.join(lines)
+
+
+def _csv_content_to_df(file_content):
+    return pd.read_csv(StringIO(file_content), index_col=0, parse_dates=True,
+                       dtype={'topic': 'category', 'model topic': 'category',
+                              'sentiment': 'category'})
 
 
 def _assert_file_contents_equal(data_path, files, file_contents):
     file_paths = [f'{data_path}/{f}' for f in files]
     for i in range(len(file_paths)):
-        assert _fs_read_file(file_paths[i]) == file_contents[i]
+        result = pd.read_feather(file_paths[i]).set_index('date')
+        # Raw data is read into Arrow-backed columns, so only compare the values
+        pd.testing.assert_frame_equal(result, _csv_content_to_df(file_contents[i]),
+                                      check_dtype=False)
@@ -1,12 +1,13 @@
 from .fixtures import CLASSIFIED_DATA_PATH
 
+import os
 import re
-from datetime import datetime, timedelta
 from io import StringIO
 import pandas as pd
 import numpy as np
 
 from newsindex.create_index import *
+from newsindex.create_index import _read_index_file
 
 EXPECTED_COLUMNS = ['negative', 'neutral', 'positive',
                     'total', 'index_value', 'smoothed_index_value']
@@ -41,52 +42,140 @@ def test_append_sentiment_index(fs, mocker):
     assert np.allclose(row, EXPECTED_LOC_ROW, equal_nan=True)
 
 
+def test_append_sentiment_index_from_csv_index(fs, mocker):
+    """Test appending to an existing CSV index writes the index to the output path."""
+    # Arrange
+    _setup_fs(fs)
+    old_index_df = _write_index_to_be_appended(file_path='data/nyt-index.csv')
+    # Act
+    result_df = append_sentiment_index()
+    file_df = _read_index_file('data/nyt-index.parquet')
+    # Assert
+    assert result_df.loc[old_index_df.index].equals(old_index_df)
+    pd.testing.assert_frame_equal(file_df, result_df)
+
+
+def test_append_sentiment_index_to_arrow_stream_file(fs, mocker):
+    """Test appending to an Arrow IPC stream index gives the same index as
+    creating the index from scratch."""
+    # Arrange
+    _setup_fs(fs, num_files=1)
+    create_sentiment_index(output_path='data/nyt-index.arrows')
+    _write_classified_file(month=2)
+    expected_df = create_sentiment_index(output_path='data/nyt-index.parquet')
+    # Act
+    result_df = append_sentiment_index(output_path='data/nyt-index.arrows')
+    file_df = _read_index_file('data/nyt-index.arrows')
+    # Assert
+    pd.testing.assert_frame_equal(result_df, expected_df)
+    pd.testing.assert_frame_equal(file_df, expected_df)
+
+
+def test_create_sentiment_index_with_cache(fs, mocker):
+    """Test creating sentiment index from cached months gives the same index."""
+    # Arrange
+    _setup_fs(fs)
+    expected_df = create_sentiment_index(cache_folder='data/index-cache')
+    mock_convert = mocker.patch('newsindex.create_index.convert_headlines_df_to_index')
+    # Act
+    result_df = create_sentiment_index(cache_folder='data/index-cache')
+    # Assert
+    assert sorted(os.listdir('data/index-cache')) == ['2022-01.parquet',
+                                                      '2022-02.parquet']
+    mock_convert.assert_not_called()
+    pd.testing.assert_frame_equal(result_df, expected_df)
+
+
+def test_create_sentiment_index_in_processes(tmp_path, monkeypatch):
+    """Test creating sentiment index in several processes gives the same index."""
+    # Arrange
+    # Spawned processes can't see a fake file system, so use a real one
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(CLASSIFIED_DATA_PATH)
+    for month in range(1, 4):
+        _write_classified_file(month=month)
+    expected_df = create_sentiment_index()
+    # Act
+    result_df = create_sentiment_index(num_processes=2)
+    # Assert
+    pd.testing.assert_frame_equal(result_df, expected_df)
+
+
+def test_convert_headlines_df_to_index_without_economics_headlines():
+    """Test converting a month without any economics headlines."""
+    # Arrange
+    file_content = _create_classified_file_content(num_rows=10)
+    classified_headlines = pd.read_csv(StringIO(file_content), index_col=0,
+                                       parse_dates=True)
+    classified_headlines['model topic'] = 'Other'
+    # Act
+    result_df = convert_headlines_df_to_index(classified_headlines)
+    # Assert
+    assert result_df.empty
+    assert result_df.columns.tolist() == EXPECTED_COLUMNS[:-1]
+
+
+def test_convert_headlines_df_to_index_with_word_counts():
+    """Test stored word counts are used instead of splitting the headlines."""
+    # Arrange
+    file_content = _create_classified_file_content(num_rows=10)
+    classified_headlines = pd.read_csv(StringIO(file_content), index_col=0,
+                                       parse_dates=True)
+    expected_df = convert_headlines_df_to_index(classified_headlines.copy())
+    counted_headlines = classified_headlines.assign(**{'word count': 3})
+    short_headlines = classified_headlines.assign(**{'word count': 2})
+    # Act
+    counted_df = convert_headlines_df_to_index(counted_headlines)
+    short_df = convert_headlines_df_to_index(short_headlines)
+    # Assert
+    pd.testing.assert_frame_equal(counted_df, expected_df)
+    assert short_df.empty
+
+
 def _setup_fs(fs, num_files=2, num_rows=10):
     """Setup fake filesystem with some files of unclassified data in raw-data dir"""
     fs.create_dir(CLASSIFIED_DATA_PATH)
 
     for month in range(1, num_files + 1):
-        file_content = _create_classified_file_content(num_rows, month=month)
-        file_name = f'2022-{month:02d}.csv'
-        fs.create_file(f'{CLASSIFIED_DATA_PATH}/{file_name}', contents=file_content)
+        _write_classified_file(num_rows, month=month)
+
+
+def _write_classified_file(num_rows=10, month=1):
+    """Write a file of classified data for the given month"""
+    file_content = _create_classified_file_content(num_rows, month=month)
+    file_name = f'2022-{month:02d}.feather'
+    df = pd.read_csv(StringIO(file_content), index_col=0, parse_dates=True)
+    df.reset_index().to_feather(f'{CLASSIFIED_DATA_PATH}/{file_name}')
 
 
 def _create_classified_file_content(num_rows=30, month=1):
     """Creates a string with the content for a classified data file"""
     dates = __create_dates_list(num_rows, month=month)
     possible_sentiments = ['Positive', 'Negative', 'Neutral']
-    sentiments = [possible_sentiments[i % 3] for i in range(num_rows)]
     possible_model_topics = ['Economics', 'Other']
-    model_topics = [possible_model_topics[i % 2] for i in range(num_rows)]
 
-    file_content = "date,headline,topic,model topic,sentiment\n"
+    lines = ["date,headline,topic,model topic,sentiment"]
     for i in range(num_rows):
         date = dates[i]
         headline = f'A headline {i}'
         topic = 'none'
-        model_topic = model_topics[i]
-        sentiment = sentiments[i]
-
-        line = ','.join([date, headline, topic, model_topic, sentiment]) + '\n'
-        file_content += line
-    return file_content
+        model_topic = possible_model_topics[i % 2]
+        sentiment = possible_sentiments[i % 3]
+        lines.append(','.join([date, headline, topic, model_topic, sentiment]))
+    return '\n'.join(lines) + '\n'
 
 
 def __create_dates_list(num_rows, month=1):
     """Creates a list of dates with a step size changing between 12 hours and 36 hours
     to simulate some dates missing headlines, while others days have multiple headlines
     """
-    dates = []
-    current_date = datetime(2022, month, 1, 0, 0, 0)
-    step_sizes = [timedelta(hours=12), timedelta(hours=36)]
-    for i in range(num_rows):
-        dates.append(current_date.strftime('%Y-%m-%d %H:%M:%S'))
-        step_size = step_sizes[i % 2]
-        current_date += step_size
-    return dates
+    step_sizes = np.where(np.arange(num_rows) % 2, 36, 12).astype('timedelta64[h]')
+    offsets = np.concatenate([[np.timedelta64(0, 'h')], np.cumsum(step_sizes)[:-1]])
+    dates = pd.DatetimeIndex(np.datetime64(f'2022-{month:02d}-01') + offsets)
+    return dates.strftime('%Y-%m-%d %H:%M:%S').tolist()
 
 
-def _write_index_to_be_appended():
+def _write_index_to_be_appended(file_path='data/nyt-index.parquet'):
     """Write index to file and return the index as a dataframe"""
     text = """date,negative,neutral,positive,total,index_value,smoothed_index_value
     2022-01-01,0.0,0.0,5.0,5.0,1.000000,NaN
@@ -103,5 +192,8 @@ def _write_index_to_be_appended():
     """
     text = re.sub(r'\s+', '\n', text)
     index_df = pd.read_csv(StringIO(text), index_col=0, parse_dates=True)
-    index_df.to_csv('data/nyt-index.csv')
+    if file_path.endswith('.csv'):
+        index_df.to_csv(file_path)
+    else:
+        index_df.to_parquet(file_path)
     return index_df
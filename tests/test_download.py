@@ -1,3 +1,5 @@
+import threading
+from concurrent.futures import Future
 import pytest
 from .fixtures import _fs_read_file, RAW_DATA_PATH
 
@@ -17,7 +19,7 @@ def test_nyt_download_history(mocker, fs):
     # Act
     nyt_download_history(start_year=2022)
     # Assert
-    assert fs.listdir(RAW_DATA_PATH) == expected_files
+    assert sorted(fs.listdir(RAW_DATA_PATH)) == expected_files
 
 
 def test_nyt_download_history_content(mocker, fs):
@@ -63,18 +65,55 @@ def test_nyt_download_history_not_overwrite(mocker, fs):
     assert _fs_read_file(f'{RAW_DATA_PATH}/2022-01.csv') == expected_file_content
 
 
+def test_nyt_download_history_stops_on_error(mocker, fs):
+    # Arrange
+    failure_handled = threading.Event()
+    original_cancel = Future.cancel
+
+    def mocked_cancel(future):
+        failure_handled.set()
+        return original_cancel(future)
+
+    def mocked_archive_metadata(date):
+        if (date.year, date.month) != (2022, 1):
+            # Only continue once the first month has failed. If the failure is never
+            # handled, give up waiting for all months at once instead of hanging
+            if not failure_handled.wait(timeout=5):
+                failure_handled.set()
+        raise RuntimeError('Daily request limit reached')
+
+    mocker.patch.object(Future, 'cancel', autospec=True, side_effect=mocked_cancel)
+    mock_archive_metadata = mocker.patch('pynytimes.NYTAPI.archive_metadata',
+                                         side_effect=mocked_archive_metadata)
+    # Act & Assert
+    with pytest.raises(RuntimeError):
+        nyt_download_history(start_year=2022, num_threads=1)
+    # The first month, and at most the month the thread had started meanwhile
+    assert mock_archive_metadata.call_count <= 2
+
+
 def test_nyt_download_latest(mocker, fs):
     # Arrange
     fs.create_dir(RAW_DATA_PATH)
+    fs.create_file(f'{RAW_DATA_PATH}/2022-01.csv')
+    fs.create_file(f'{RAW_DATA_PATH}/.DS_Store')
 
     dummy_articles = _get_dummy_articles(num_rows=1)
     mocker.patch('pynytimes.NYTAPI.archive_metadata', return_value=dummy_articles)
-    mocker.patch('os.listdir', return_value=['2022-01-01.csv'])
     expected_files = _create_expected_listdir_content(start_year=2022)
     # Act
     nyt_download_latest()
     # Assert
-    assert fs.listdir(RAW_DATA_PATH) == expected_files
+    assert sorted(fs.listdir(RAW_DATA_PATH)) == ['.DS_Store'] + expected_files
+
+
+def test_nyt_download_latest_without_downloaded_files(fs):
+    # Arrange
+    fs.create_dir(RAW_DATA_PATH)
+    fs.create_file(f'{RAW_DATA_PATH}/.DS_Store')
+    # Act & Assert
+    with pytest.raises(FileNotFoundError, match=RAW_DATA_PATH):
+        nyt_download_latest()
 
 
 def _create_expected_listdir_content(start_year=2022):
@@ -101,6 +140,23 @@ def test_download_nyt_headlines_for_month(mocker, fs):
     assert _fs_read_file(f'{RAW_DATA_PATH}/2022-01.csv') == expected_file_content
 
 
+def test_download_nyt_headlines_for_month_with_line_breaks(mocker, fs):
+    # Arrange
+    fs.makedirs(RAW_DATA_PATH)
+    dummy_articles = _get_dummy_articles(num_rows=2)
+    dummy_articles[0]['headline']['main'] = 'head\rline'
+    dummy_articles[1]['headline']['main'] = 'head\nline'
+    mocker.patch('pynytimes.NYTAPI.archive_metadata', return_value=dummy_articles)
+    # Act
+    _download_nyt_headlines_for_month(month=1, year=2022, output_folder=RAW_DATA_PATH)
+    # Assert
+    assert _fs_read_file(f'{RAW_DATA_PATH}/2022-01.csv') == (
+        'date,headline,topic\n'
+        '2022-01-01,head line,topic1\n'
+        '2022-01-02,head line,topic2\n'
+    )
+
+
 def _get_dummy_articles(num_rows=1):
     dummy_articles = []
     for i in range(1, num_rows + 1):
@@ -114,9 +170,9 @@ def _get_dummy_articles(num_rows=1):
 
 
 def _create_expected_file_content(dummy_articles):
-    expected_file_content = 'date,headline,topic\n'
+    lines = ['date,headline,topic\n']
     for article in dummy_articles:
-        expected_file_content += f"{article['pub_date']},"\
-                                 f"{article['headline']['main']},"\
-                                 f"{article['news_desk']}\n"
-    return expected_file_content
+        lines.append(f"{article['pub_date']},"
+                     f"{article['headline']['main']},"
+                     f"{article['news_desk']}\n")
+    return ''.join(lines)